@@ -1,9 +1,35 @@
+import functools
+import os
 import re
-import unicodedata
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+try:
+    import ahocorasick  # pyahocorasick: prefiltro literal opcional
+
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    import pyarrow  # noqa: F401  strings respaldados por Arrow si está instalado
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    from joblib import Parallel, delayed  # paralelización opcional por chunks
+
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
+
+# Por debajo de este tamaño no compensa el coste de arrancar procesos
+_PARALLEL_MIN_ROWS = 20000
+
 # === CONFIG ===
 BASE_DIR = Path(__file__).resolve().parent
 INPUT_FILE = BASE_DIR / "BANJIO.csv"
@@ -116,21 +142,166 @@ raw_rules = [
     ),
 ]
 
-compiled_rules = [
-    (re.compile(pat, re.IGNORECASE | re.UNICODE), label, debug)
-    for pat, label, debug in raw_rules
-]
+def _rule_flags(pat: str) -> int:
+    """Flags de compilación para un patrón.
+
+    Los patrones 100% ASCII usan re.ASCII: \\w/\\s/\\d van por la tabla ASCII
+    en vez de la base de propiedades Unicode. Solo los patrones con acentos
+    (ó, etc.) necesitan re.UNICODE.
+    """
+    if pat.isascii():
+        return re.IGNORECASE | re.ASCII
+    return re.IGNORECASE | re.UNICODE
+
+
+# Etiquetas que se resuelven devolviendo el texto RAW de la fila
+RAW_LABEL_SET = {"por *", "__RAW__por_mxn_cargo"}
+
+# Regexes auxiliares precompiladas (se usan fila a fila en build_label)
+_PIPE_RE = re.compile(r"\s*\|\s*")
+_WS_RE = re.compile(r"\s+")
+_CARGO_RE = re.compile(r"Cargo a cuenta por deposito con cheque .*?\|", re.IGNORECASE)
+
+# Palabra clave literal (sobre el texto normalizado) que debe aparecer para
+# que la regla pueda hacer match; se usa como prefiltro Aho-Corasick para no
+# pasar el regex completo por filas que no contienen el literal. Las reglas
+# RAW no llevan keyword porque comparan contra el texto sin normalizar.
+_RULE_KEYWORDS = {
+    "RAW_PATTERN_AMOUNT_REF_7": "ref/docto",
+    "TRASPASO DE SALDOS": "traspaso de saldos",
+    "CUOTA OBRERO PATRONAL": "cuota obrero patronal",
+    "mxn numero de cheque con dígitos": "numero de cheque",
+    "SPEI Enviado con Beneficiario": "spei enviado",
+    "SPEI Recibido con Ordenante": "spei recibido",
+    "Devolución de SPEI con Ordenante": "devolucion de spei",
+    "Retiro de Recursos con Beneficiario": "retiro de recursos",
+    "Entrega de Recursos con Ordenante": "entrega de recursos",
+    "Comisión | Dispersion Grupo con monto y Recibo": "comision",
+    "Comisión | Número de Referencia (exacto)": "comision",
+    "^Comisión por": "comision",
+    "Depósito en Efectivo": "deposito",
+    "Depósito Negocios Afiliados": "deposito",
+    "Depósito SBC de Cobro Inmediato": "deposito",
+    "Depósito para Eliminación de Sobregiro con monto": "deposito",
+    "SPEI Enviado": "spei enviado",
+    "SPEI Recibido": "spei recibido",
+    "Devolución de SPEI": "devolucion de spei",
+    "Entrega de Recursos": "entrega de recursos",
+    "Retiro de Recursos": "retiro de recursos",
+    "IVA": "iva comision",
+    "Pago de Servicios TELMEX EN LINEA": "telmex",
+    "Nómina": "nomina",
+}
+
+
+@functools.lru_cache(maxsize=1)
+def get_keyword_automaton():
+    """Construye (una sola vez) el autómata Aho-Corasick de keywords."""
+    if not AHOCORASICK_AVAILABLE:
+        return None
+    auto = ahocorasick.Automaton()
+    for kw in set(_RULE_KEYWORDS.values()):
+        auto.add_word(kw, kw)
+    auto.make_automaton()
+    return auto
+
+
+def _build_rule_plan(rules):
+    """Funde en un solo regex de alternancia las reglas sin grupos ni
+    tratamiento RAW que sean consecutivas, para detectar en una única
+    pasada de str.extract qué filas casan con alguna regla del lote.
+
+    El regex fundido solo prefiltra: la alternancia decide por posición del
+    match en el texto, no por orden de regla, así que la etiqueta se asigna
+    después re-probando las reglas individuales del lote, en orden, sobre el
+    subconjunto (pequeño) de filas que ya casaron. Las reglas con grupos de
+    captura y las RAW se mantienen individuales y en su posición; la
+    prioridad por orden de regla se conserva por tanto dentro y entre lotes.
+    """
+    plan = []
+    batch = []
+
+    def _keywords_for(debugs):
+        # Solo se puede prefiltrar un paso si TODAS sus reglas tienen keyword
+        kws = [_RULE_KEYWORDS.get(d) for d in debugs]
+        if any(kw is None for kw in kws):
+            return None
+        return frozenset(kws)
+
+    def _flush():
+        if not batch:
+            return
+        if len(batch) == 1:
+            pat, label, debug = batch[0]
+            plan.append(
+                (
+                    # Las reglas ancladas al inicio usan str.match, que abandona
+                    # la fila al primer carácter en vez de probar cada offset.
+                    "match" if pat.startswith(("^", r"\A")) else "plain",
+                    re.compile(pat, _rule_flags(pat)),
+                    label,
+                    debug,
+                    _keywords_for([debug]),
+                )
+            )
+        else:
+            big = "|".join(f"(?P<r{i}>{pat})" for i, (pat, _, _) in enumerate(batch))
+            plan.append(
+                (
+                    "fused",
+                    re.compile(big, _rule_flags(big)),
+                    [
+                        (re.compile(pat, _rule_flags(pat)), label, debug)
+                        for pat, label, debug in batch
+                    ],
+                    _keywords_for([debug for _, _, debug in batch]),
+                )
+            )
+        batch.clear()
+
+    for pat, label, debug in rules:
+        compiled = re.compile(pat, _rule_flags(pat))
+        if compiled.groups > 0:
+            _flush()
+            plan.append(("group", compiled, label, debug, _keywords_for([debug])))
+        elif label in RAW_LABEL_SET:
+            _flush()
+            plan.append(("raw", compiled, label, debug, None))
+        else:
+            # Las reglas sin grupos solo corren sobre la columna normalizada,
+            # que ya llega sin espacios al inicio: el prefijo ^\s* es redundante
+            # y obliga al motor a evaluarlo por fila.
+            if pat.startswith(r"^\s*"):
+                pat = "^" + pat[4:]
+            batch.append((pat, label, debug))
+    _flush()
+    return plan
+
+
+@functools.lru_cache(maxsize=1)
+def get_rule_plan():
+    """Plan de reglas compilado, memoizado a nivel de proceso."""
+    return _build_rule_plan(raw_rules)
+
+
+# Los extractos solo traen este conjunto fijo de acentos, así que basta una
+# tabla de traducción (mapeo por carácter en C) en vez de NFKD + filtro.
+_ACCENT_TABLE = str.maketrans("áéíóúüÁÉÍÓÚÜñÑ:", "aeiouuAEIOUUnN ")
 
 
 def normalize_text(s: str) -> str:
-    if s is None:
+    if not s:
         return ""
-    s = str(s)
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    s = s.replace(":", " ")
-    s = re.sub(r"\s+", " ", s).strip().lower()
-    return s
+    return _WS_RE.sub(" ", str(s).translate(_ACCENT_TABLE)).strip().lower()
+
+
+def _text_series(s: pd.Series) -> pd.Series:
+    """Rellena NaN y castea a str solo si la columna no es ya de strings.
+
+    Evita degradar una columna string[pyarrow] a object con astype(str).
+    """
+    s = s.fillna("")
+    return s.astype(str) if s.dtype == object else s
 
 
 def apply_rules_vectorized(df: pd.DataFrame, text_col: str):
@@ -139,25 +310,75 @@ def apply_rules_vectorized(df: pd.DataFrame, text_col: str):
     # df['score'] = None
 
     norm_col = f"{text_col}_norm"
-    raw_col = f"{text_col}_raw"
-    df[norm_col] = df[text_col].fillna("").astype(str).map(normalize_text)
-    df[raw_col] = df[text_col].fillna("").astype(str)
+    df[norm_col] = (
+        _text_series(df[text_col])
+        .str.translate(_ACCENT_TABLE)
+        .str.lower()
+        .str.replace(_WS_RE, " ", regex=True)
+        .str.strip()
+    )
+
+    # Copia sin normalizar: solo la usan las reglas RAW y las de captura,
+    # así que se materializa de forma perezosa la primera vez que haga falta.
+    raw_series = None
 
-    RAW_LABEL_SET = {"por *", "__RAW__por_mxn_cargo"}
+    # Prefiltro literal: conjunto de keywords presentes en cada fila
+    kw_hits = None
+    keyword_automaton = get_keyword_automaton()
+    if keyword_automaton is not None:
+        kw_hits = df[norm_col].map(
+            lambda s: frozenset(kw for _, kw in keyword_automaton.iter(s))
+        )
 
-    for pattern, label, debug in compiled_rules:
-        mask_unassigned = df["label"].isna()
-        if not mask_unassigned.any():
+    # Índice de filas aún sin etiqueta: se recorta tras cada regla en vez de
+    # recalcular df["label"].isna() y re-copiar las columnas enteras por regla.
+    norm_series = df[norm_col]
+    pending = df.index
+
+    for step in get_rule_plan():
+        if len(pending) == 0:
             break
 
-        has_group = pattern.groups > 0
+        kind = step[0]
+        step_keywords = step[-1]
 
-        if has_group:
-            extracted = df.loc[mask_unassigned, raw_col].str.extract(
-                pattern, expand=True
-            )
+        candidates = pending
+        if kw_hits is not None and step_keywords is not None:
+            candidates = pending[~kw_hits.loc[pending].map(step_keywords.isdisjoint)]
+            if len(candidates) == 0:
+                continue
+
+        if kind == "fused":
+            _, pattern, fused_rules, _ = step
+            sub = norm_series.loc[candidates]
+            extracted = sub.str.extract(pattern, expand=True)
+            matched = extracted.notna().any(axis=1)
+            idx = matched[matched].index
+            if not idx.empty:
+                # La alternancia gana por posición del match, no por orden
+                # de regla; la prioridad real se resuelve re-probando cada
+                # regla del lote, en orden, solo sobre las filas que ya
+                # sabemos que casan con alguna.
+                restantes = idx
+                for rule_pat, label, _debug in fused_rules:
+                    if len(restantes) == 0:
+                        break
+                    m = sub.loc[restantes].str.contains(rule_pat, na=False)
+                    sel = m[m].index
+                    if not sel.empty:
+                        df.loc[sel, "label"] = label
+                        restantes = restantes[~restantes.isin(sel)]
+                pending = pending[~pending.isin(idx)]
+            continue
+
+        _, pattern, label, debug, _ = step
+
+        if kind == "group":
+            if raw_series is None:
+                raw_series = _text_series(df[text_col])
+            extracted = raw_series.loc[candidates].str.extract(pattern, expand=True)
             if extracted.dropna(how="all").empty:
-                extracted = df.loc[mask_unassigned, norm_col].str.extract(
+                extracted = norm_series.loc[candidates].str.extract(
                     pattern, expand=True
                 )
 
@@ -165,59 +386,61 @@ def apply_rules_vectorized(df: pd.DataFrame, text_col: str):
             if not idx.empty:
                 first_group = extracted.loc[idx, 0]
 
-                def build_label(g):
-                    if pd.isna(g):
-                        return label
-                    gstr = str(g).strip()
-                    gstr = re.sub(r"\s*\|\s*", " ", gstr)
-                    gstr = re.sub(r"\s+", " ", gstr).strip()
-
-                    if "****" in label:
-                        return label.replace("****", gstr)
-                    if label.lower().startswith(
-                        "spei enviado"
-                    ) or label.lower().startswith("spei recibido"):
-                        return f"{label}: {gstr}"
-                    if label.lower().startswith("devolución de spei"):
-                        return f"{label}: {gstr}"
-                    if label.lower().startswith("retiro de recursos"):
-                        return f"{label} Beneficiario {gstr}"
-                    if label.lower().startswith("entrega de recursos"):
-                        return f"{label} {gstr}"
-                    return f"{label} {gstr}"
-
-                df.loc[idx, "label"] = first_group.map(build_label)
+                # Limpieza del grupo capturado en operaciones vectorizadas
+                g = (
+                    first_group.str.replace(_PIPE_RE, " ", regex=True)
+                    .str.replace(_WS_RE, " ", regex=True)
+                    .str.strip()
+                )
+
+                # El formato depende solo de la etiqueta, se decide una vez
+                label_low = label.lower()
+                if "****" in label:
+                    prefix, _, suffix = label.partition("****")
+                    out = prefix + g + suffix
+                elif label_low.startswith(
+                    ("spei enviado", "spei recibido", "devolución de spei")
+                ):
+                    out = label + ": " + g
+                elif label_low.startswith("retiro de recursos"):
+                    out = label + " Beneficiario " + g
+                else:
+                    out = label + " " + g
+
+                # Filas con grupo vacío (NaN) conservan la etiqueta base
+                df.loc[idx, "label"] = out.fillna(label)
                 # df.loc[idx, 'method'] = f"rule:{debug}"
                 # df.loc[idx, 'score'] = 100
 
+        elif kind == "raw":
+            if raw_series is None:
+                raw_series = _text_series(df[text_col])
+            mask_match_series = raw_series.loc[candidates].str.contains(
+                pattern, na=False
+            )
+            idx = mask_match_series[mask_match_series].index
+            if not idx.empty:
+                fixed = raw_series.loc[idx]
+                if label == "__RAW__por_mxn_cargo":
+                    # 🚩 limpieza especial: quitar "Cargo a cuenta..." hasta el primer "|"
+                    fixed = fixed.str.replace(_CARGO_RE, "", regex=True)
+                df.loc[idx, "label"] = fixed.str.strip()
+                # df.loc[idx, 'method'] = f"rule:{debug}"
+                # df.loc[idx, 'score'] = 100
         else:
-            if label in RAW_LABEL_SET:
-                mask_match_series = df.loc[mask_unassigned, raw_col].str.contains(
-                    pattern, na=False
-                )
-                idx = mask_match_series[mask_match_series].index
-                if not idx.empty:
-                    fixed = df.loc[idx, raw_col].astype(str)
-                    if label == "__RAW__por_mxn_cargo":
-                        # 🚩 limpieza especial: quitar "Cargo a cuenta..." hasta el primer "|"
-                        fixed = fixed.str.replace(
-                            r"Cargo a cuenta por deposito con cheque .*?\|",
-                            "",
-                            regex=True,
-                            flags=re.IGNORECASE,
-                        )
-                    df.loc[idx, "label"] = fixed.str.strip()
-                    # df.loc[idx, 'method'] = f"rule:{debug}"
-                    # df.loc[idx, 'score'] = 100
+            sub = norm_series.loc[candidates]
+            if kind == "match":
+                mask_match_series = sub.str.match(pattern, na=False)
             else:
-                mask_match_series = df.loc[mask_unassigned, norm_col].str.contains(
-                    pattern, na=False
-                )
-                idx = mask_match_series[mask_match_series].index
-                if not idx.empty:
-                    df.loc[idx, "label"] = label
-                    # df.loc[idx, 'method'] = f"rule:{debug}"
-                    # df.loc[idx, 'score'] = 100
+                mask_match_series = sub.str.contains(pattern, na=False)
+            idx = mask_match_series[mask_match_series].index
+            if not idx.empty:
+                df.loc[idx, "label"] = label
+                # df.loc[idx, 'method'] = f"rule:{debug}"
+                # df.loc[idx, 'score'] = 100
+
+        if not idx.empty:
+            pending = pending[~pending.isin(idx)]
 
     df["label"] = df["label"].fillna("UNKNOWN")
     # df['method'] = df['method'].fillna("none")
@@ -225,18 +448,70 @@ def apply_rules_vectorized(df: pd.DataFrame, text_col: str):
     return df
 
 
+def _write_output_csv(df: pd.DataFrame) -> None:
+    """Escribe el CSV de salida, con el writer multihilo de Arrow si se puede.
+
+    El BOM se antepone a mano porque Arrow escribe UTF-8 pelado y Excel
+    espera utf-8-sig, igual que producía to_csv.
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            import pyarrow.csv as pa_csv
+
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            with OUTPUT_FILE.open("wb") as f:
+                f.write(b"\xef\xbb\xbf")
+                pa_csv.write_csv(table, f)
+            return
+        except (ValueError, TypeError, pyarrow.ArrowException):
+            pass
+    df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8-sig")
+
+
 def main():
-    df = pd.read_csv(INPUT_FILE, encoding="latin1")
+    if PYARROW_AVAILABLE:
+        # Parseo multihilo y columnas de texto ya en buffers Arrow
+        try:
+            df = pd.read_csv(
+                INPUT_FILE,
+                encoding="latin1",
+                engine="pyarrow",
+                dtype_backend="pyarrow",
+            )
+        except (ValueError, TypeError):
+            # Versiones de pandas sin soporte completo del engine pyarrow
+            df = pd.read_csv(INPUT_FILE, encoding="latin1")
+    else:
+        df = pd.read_csv(INPUT_FILE, encoding="latin1")
     if DESCRIPTION_COL not in df.columns:
         raise ValueError(f"La columna '{DESCRIPTION_COL}' no existe en el archivo CSV")
 
-    df = apply_rules_vectorized(df, DESCRIPTION_COL)
+    if PYARROW_AVAILABLE:
+        # Los kernels de Arrow corren contains/extract sobre buffers UTF-8
+        # contiguos; con dtype object cada celda pasa por el intérprete.
+        df[DESCRIPTION_COL] = df[DESCRIPTION_COL].astype("string[pyarrow]")
+
+    n_jobs = os.cpu_count() or 1
+    if JOBLIB_AVAILABLE and n_jobs > 1 and len(df) >= _PARALLEL_MIN_ROWS:
+        # Cada fila se etiqueta de forma independiente, así que el DataFrame
+        # se puede trocear por filas y procesar un chunk por núcleo. Se
+        # parten las posiciones y se rebana con iloc: array_split sobre el
+        # DataFrame lo coerciona a un array object y rompe a los workers.
+        positions = np.array_split(np.arange(len(df)), n_jobs)
+        results = Parallel(n_jobs=n_jobs, backend="loky")(
+            delayed(apply_rules_vectorized)(df.iloc[idx].copy(), DESCRIPTION_COL)
+            for idx in positions
+            if len(idx)
+        )
+        df = pd.concat(results)
+    else:
+        df = apply_rules_vectorized(df, DESCRIPTION_COL)
 
     norm_col = f"{DESCRIPTION_COL}_norm"
     raw_col = f"{DESCRIPTION_COL}_raw"
     df = df.drop(columns=[c for c in (norm_col, raw_col) if c in df.columns])
 
-    df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8-sig")
+    _write_output_csv(df)
     print(f"✅ Limpieza completada. Archivo guardado en: {OUTPUT_FILE}")
 
 
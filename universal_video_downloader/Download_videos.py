@@ -26,7 +26,7 @@ USO (ejemplos):
   python mega_batch_downloader_patched.py --url "https://sitio.com/mi-video" -o "D:\\Videos" --use-selenium
 
 DEPENDENCIAS:
-  pip install -U git+https://github.com/yt-dlp/yt-dlp.git requests beautifulsoup4 tqdm selenium-wire webdriver-manager
+  pip install -U git+https://github.com/yt-dlp/yt-dlp.git requests beautifulsoup4 lxml tqdm selenium-wire webdriver-manager
   ffmpeg instalado y en PATH
 
 LEGAL & ÉTICA:
@@ -36,18 +36,33 @@ LEGAL & ÉTICA:
 """
 
 import argparse
+import atexit
+import csv
+import functools
 import json
 import os
 import re
 import subprocess
 import sys
+import threading
 import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from urllib.parse import unquote, urljoin, urlparse
+from urllib.parse import (
+    parse_qsl,
+    quote,
+    unquote,
+    urlencode,
+    urljoin,
+    urlparse,
+    urlsplit,
+    urlunsplit,
+)
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter, Retry
 from tqdm import tqdm
 
 # intentos de importar yt-dlp; si no está, el script seguirá e intentará fallbacks
@@ -65,32 +80,199 @@ try:
 except Exception:
     SELENIUM_WIRE_AVAILABLE = False
 
+# lxml (opcional): parser C mucho más rápido que html.parser para BeautifulSoup
+try:
+    import lxml.html
+
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# selectolax (opcional): parser Lexbor aún más rápido; BS4 queda como fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# aiohttp (opcional): fetch asíncrono de páginas y segmentos HLS
+try:
+    import asyncio
+
+    import aiohttp
+
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# m3u8 (opcional): parseo de playlists HLS en Python
+try:
+    import m3u8 as m3u8_lib
+
+    M3U8_LIB_AVAILABLE = True
+except ImportError:
+    M3U8_LIB_AVAILABLE = False
+
+HLS_ASYNC_AVAILABLE = AIOHTTP_AVAILABLE and M3U8_LIB_AVAILABLE
+
+# httpx (opcional): cliente HTTP/2 para el fetch de páginas (--http2)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# orjson (opcional): parseo JSON en C, ~3x más rápido para bloques JSON-LD
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 # -------------------
 # Helpers
 # -------------------
 DEFAULT_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
 
+# Regexes precompiladas usadas en los bucles calientes de parseo/descarga
+MEDIA_EXT_RE = re.compile(
+    r"\.(mp4|mkv|webm|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|m3u8|mpd)(\?|$)", re.IGNORECASE
+)
+LDJSON_EXT_RE = re.compile(
+    r"(m3u8|mp4|webm|mkv|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|mpd)(\?|$)", re.IGNORECASE
+)
+DIRECT_EXT_RE = re.compile(
+    r"\.(mp4|mkv|webm|mov|ogg|avi|flv|ts|m4v|3gp|mpeg)", re.IGNORECASE
+)
+M3U8_RE = re.compile(r"\.m3u8(\?|$)", re.IGNORECASE)
+MANIFEST_RE = re.compile(r"\.(m3u8|mpd)(\?|$)|/manifest(\?|$)|/playlist(\?|$)", re.IGNORECASE)
+CAPTURE_RE = re.compile(r"\.m3u8(\?|$)|\.mp4(\?|$)|/playlist/|/manifest", re.IGNORECASE)
+# Alternancia combinada para la pasada única sobre el HTML crudo: captura
+# tanto destinos href="...ext" como URLs absolutas de medios en scripts
+_ALL_MEDIA_RE = re.compile(
+    r"""(?:href=["']([^"']+\.(?:mp4|mkv|webm|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|m3u8|mpd)(?:\?[^"']*)?)["'])"""
+    r"""|(https?://[^\s"'<>]+?\.(?:mp4|m3u8|webm|mkv|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|mpd)(?:\?[^\s"'<>]*)?)""",
+    re.IGNORECASE,
+)
+# Rutas Windows tipo C:\... o C:/... (ambos separadores en un solo patrón)
+_WIN_DRIVE_RE = re.compile(r"^([A-Za-z]):[\\/](.*)$")
+_RATE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMGkmg]?)$")
+# Tabla de traducción para sanear nombres de fichero (C-level, sin regex)
+_FN_TABLE = str.maketrans({c: "_" for c in '\\/*?:"<>|'})
+
+# urlparse memoizado: la misma URL se inspecciona en el atajo directo, el
+# clasificador HLS/directo y el armado de nombres de salida
+_urlparse = functools.lru_cache(maxsize=4096)(urlparse)
+
+# Atributos property/name de <meta> que apuntan a un stream de vídeo
+META_VIDEO_PROPS = frozenset(
+    {"og:video", "og:video:url", "og:video_secure_url", "twitter:player:stream"}
+)
+
+# Claves de JSON-LD que pueden apuntar a un fichero de media
+_LDJSON_KEYS = frozenset({"contentUrl", "embedUrl", "url", "video", "videoUrl"})
+
+# Limita los ffmpeg simultáneos al número de núcleos: así -w puede subirse
+# cuanto haga falta para solapar E/S de red sin sobresuscribir la CPU con
+# más muxes/remuxes de los que la máquina puede ejecutar a la vez
+_FFMPEG_SEM = threading.BoundedSemaphore(os.cpu_count() or 2)
+
+# Strainer compartido para el fallback BS4 (solo las etiquetas que miramos)
+_MEDIA_STRAINER = SoupStrainer(["video", "source", "meta", "script"])
+
+# XPath equivalente a META_VIDEO_PROPS para el camino lxml (se evalúa en C)
+_META_XPATH = (
+    '//meta[@property="og:video" or @property="og:video:url" or '
+    '@property="og:video_secure_url" or @name="twitter:player:stream"]'
+)
+
+
+class TokenBucket:
+    """Limitador de caudal token-bucket compartido entre workers.
+
+    `rate_bps` son bytes/segundo; `capacity` (por defecto = rate) acota las
+    ráfagas. Los hilos llaman a consume(n) antes de escribir cada chunk y
+    esperan lo justo hasta que haya tokens disponibles.
+    """
+
+    def __init__(self, rate_bps, capacity=None):
+        self.rate = float(rate_bps)
+        self.capacity = float(capacity or rate_bps)
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.cond = threading.Condition()
+
+    def consume(self, n):
+        # Trocear peticiones mayores que la capacidad: los bucles de descarga
+        # consumen en chunks de 1 MiB y un límite por debajo de eso dejaría
+        # la espera girando para siempre (nunca habría tokens suficientes)
+        while n > 0:
+            piece = min(n, self.capacity)
+            n -= piece
+            with self.cond:
+                while True:
+                    now = time.monotonic()
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + (now - self.timestamp) * self.rate,
+                    )
+                    self.timestamp = now
+                    if self.tokens >= piece:
+                        self.tokens -= piece
+                        break
+                    self.cond.wait(timeout=(piece - self.tokens) / self.rate)
+
+
+def parse_rate_limit(s):
+    """Convierte un límite tipo '500K' / '2M' a bytes por segundo (o None)."""
+    if not s:
+        return None
+    m = _RATE_RE.match(str(s).strip())
+    if not m:
+        return None
+    mult = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}[m.group(2).upper()]
+    return int(float(m.group(1)) * mult)
+
 
 def run_cmd(cmd, timeout=300, env=None):
     """Ejecuta un comando del sistema y devuelve (returncode, stdout, stderr).
 
-    Wrapper ligero alrededor de subprocess.run, con timeout configurable.
+    Descarta stdout y conserva solo las últimas líneas de stderr en un
+    deque acotado (vía hilo lector), en vez de acumular en memoria el log
+    completo de procesos largos como ffmpeg. stdout se devuelve vacío y
+    stderr se devuelve como bytes: la mayoría de llamadores solo mira el
+    returncode, así que decodificar megabytes de progreso de ffmpeg sería
+    trabajo tirado; quien necesite texto decodifica él mismo.
     """
     try:
-        proc = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            stdout=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE,
-            timeout=timeout,
             env=env,
         )
-        return (
-            proc.returncode,
-            proc.stdout.decode("utf-8", errors="ignore"),
-            proc.stderr.decode("utf-8", errors="ignore"),
-        )
+    except FileNotFoundError as e:
+        return 127, b"", str(e).encode()
+
+    tail = deque(maxlen=64)
+
+    def _drain():
+        for line in proc.stderr:
+            tail.append(line)
+
+    reader = threading.Thread(target=_drain, daemon=True)
+    reader.start()
+    try:
+        proc.wait(timeout=timeout)
     except subprocess.TimeoutExpired:
-        return 124, "", "timeout"
+        proc.kill()
+        proc.wait()
+        return 124, b"", b"timeout"
+    reader.join(timeout=5)
+    return proc.returncode, b"", b"".join(tail)
 
 
 def safe_filename(s):
@@ -98,8 +280,8 @@ def safe_filename(s):
 
     Elimina caracteres problemáticos en Windows/Linux y limita la longitud.
     """
-    s = re.sub(r'[\\/*?:"<>|]', "_", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = s.translate(_FN_TABLE)
+    s = " ".join(s.split())
     return s[:200]
 
 
@@ -115,18 +297,12 @@ def normalize_outdir_for_os(outdir):
     """
     if not outdir:
         return outdir
-    # quick detect Windows drive notation
-    m = re.match(r"^([A-Za-z]):\\(.*)$", outdir)
+    # quick detect Windows drive notation (C:\... o C:/...)
+    m = _WIN_DRIVE_RE.match(outdir)
     if m and sys.platform.startswith("linux"):
         drive = m.group(1).lower()
         rest = m.group(2).replace("\\", "/")
         return f"/mnt/{drive}/{rest}"
-    # también aceptar D:/path
-    m2 = re.match(r"^([A-Za-z]):/(.*)$", outdir)
-    if m2 and sys.platform.startswith("linux"):
-        drive = m2.group(1).lower()
-        rest = m2.group(2)
-        return f"/mnt/{drive}/{rest}"
     return outdir
 
 
@@ -135,8 +311,9 @@ def normalize_outdir_for_os(outdir):
 # -------------------
 
 
+@functools.lru_cache(maxsize=4096)
 def sanitize_url(raw):
-    """Sanea una URL de entrada.
+    """Sanea una URL de entrada (memoizada por URL).
 
     Quita backslashes, decodifica percent-encoding y trims de espacios y
     comillas. Devuelve la URL lista para usar en peticiones.
@@ -153,6 +330,51 @@ def sanitize_url(raw):
     return s
 
 
+def canon_url(u):
+    """Forma canónica de una URL, usada solo como clave de dedupe.
+
+    Esquema y host en minúsculas, sin fragmento, path re-quoteado y query
+    ordenada: variantes equivalentes del mismo recurso colapsan en una y no
+    se descarga dos veces. La URL original es la que se descarga.
+    """
+    try:
+        p = urlsplit(u)
+        return urlunsplit(
+            (
+                p.scheme.lower(),
+                p.netloc.lower(),
+                quote(unquote(p.path), safe="/%"),
+                urlencode(sorted(parse_qsl(p.query, keep_blank_values=True))),
+                "",
+            )
+        )
+    except Exception:
+        return u
+
+
+def _is_direct_media(url):
+    """True si la URL apunta directamente a un fichero de vídeo conocido.
+
+    Sirve de atajo para no pagar la inicialización de yt-dlp en enlaces
+    planos de CDN; los manifests (m3u8/mpd) quedan fuera a propósito.
+    """
+    try:
+        path = _urlparse(url).path
+    except Exception:
+        return False
+    return bool(MEDIA_EXT_RE.search(path)) and not MANIFEST_RE.search(path)
+
+
+# Mensajes conocidos de bloqueo en una sola alternancia: un único escaneo
+# del stderr (sin copia en minúsculas) en vez de seis búsquedas de substring
+_BLOCK_RE = re.compile(
+    r"(?P<piracy>this website is no longer supported|\[piracy\])"
+    r"|(?P<alg>unknown algorithm(?: id)?)"
+    r"|(?P<extractor>extractor error|http error)",
+    re.IGNORECASE,
+)
+
+
 def yt_dlp_detects_block(text):
     """Detecta bloqueos conocidos en la salida de yt-dlp.
 
@@ -161,12 +383,17 @@ def yt_dlp_detects_block(text):
     """
     if not text:
         return None
-    low = text.lower()
-    if "this website is no longer supported" in low or "[piracy]" in low:
+    found = set()
+    for m in _BLOCK_RE.finditer(text):
+        found.add(m.lastgroup)
+        if "piracy" in found:
+            break
+    # misma prioridad que las comprobaciones originales
+    if "piracy" in found:
         return "PIRACY_BLOCK"
-    if "unknown algorithm id" in low or "unknown algorithm" in low:
+    if "alg" in found:
         return "UNKNOWN_ALG"
-    if "extractor error" in low or "http error" in low:
+    if "extractor" in found:
         return "EXTRACTOR_ERROR"
     return None
 
@@ -175,6 +402,29 @@ def yt_dlp_detects_block(text):
 # -------------------
 
 
+class _CaptureLogger:
+    """Logger para YoutubeDL que acumula los mensajes en memoria.
+
+    Permite pasar yt_dlp_detects_block sobre la salida del intento
+    in-process, sin relanzar yt-dlp como subproceso solo para leer stderr.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def debug(self, msg):
+        self.lines.append(str(msg))
+
+    def warning(self, msg):
+        self.lines.append(str(msg))
+
+    def error(self, msg):
+        self.lines.append(str(msg))
+
+    def text(self):
+        return "\n".join(self.lines)
+
+
 def download_with_ytdlp(url, outdir, opts):
     """Intenta descargar usando yt-dlp con las opciones proporcionadas.
 
@@ -196,6 +446,10 @@ def download_with_ytdlp(url, outdir, opts):
         "noplaylist": opts.get("noplaylist", False),
         "quiet": True,
         "no_warnings": True,
+        # Playlists perezosas: no enumerar todas las entradas por adelantado.
+        # (extract_flat no vale aquí: las entradas planas se devuelven sin
+        # descargarse y la playlist terminaría "OK" con cero ficheros)
+        "lazy_playlist": True,
     }
     if opts.get("cookiefile"):
         ydl_opts["cookiefile"] = opts.get("cookiefile")
@@ -217,13 +471,31 @@ def download_with_ytdlp(url, outdir, opts):
                 "preferredquality": "192",
             }
         ]
+    # Logger por hilo (mismo objeto entre llamadas para no invalidar la
+    # caché de la instancia YoutubeDL); se vacía en cada intento.
+    logger = getattr(_THREAD_LOCAL, "ydl_logger", None)
+    if logger is None:
+        logger = _CaptureLogger()
+        _THREAD_LOCAL.ydl_logger = logger
+    logger.lines.clear()
+    ydl_opts["logger"] = logger
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            title = info.get("title") or url
-            return True, f"yt-dlp OK: {title}"
+        # Reutilizar la instancia YoutubeDL por hilo: su construcción carga
+        # cientos de extractores y es amortizable en un lote de URLs.
+        ydl_key = repr(sorted(ydl_opts.items(), key=lambda kv: kv[0]))
+        ydl = getattr(_THREAD_LOCAL, "ydl", None)
+        if ydl is None or getattr(_THREAD_LOCAL, "ydl_key", None) != ydl_key:
+            ydl = YoutubeDL(ydl_opts)
+            _THREAD_LOCAL.ydl = ydl
+            _THREAD_LOCAL.ydl_key = ydl_key
+        info = ydl.extract_info(url, download=True)
+        title = info.get("title") or url
+        return True, f"yt-dlp OK: {title}"
     except Exception as e:
-        # intentar extraer mensajes de la excepción
+        # devolver también los mensajes capturados para detectar bloqueos
+        captured = logger.text()
+        if captured:
+            return False, f"yt-dlp fallo: {e}\n{captured}"
         return False, f"yt-dlp fallo: {e}"
 
 
@@ -231,18 +503,103 @@ def download_with_ytdlp(url, outdir, opts):
 # -------------------
 
 
-def get_page_text(url, headers, timeout=20, cookies=None, proxy=None):
-    try:
+_THREAD_LOCAL = threading.local()
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_cookies(cookie_string):
+    """Parsea una cadena "k=v; k2=v2" a una tupla de pares (memoizada)."""
+    pairs = []
+    for part in cookie_string.split(";"):
+        if "=" in part:
+            k, v = part.strip().split("=", 1)
+            pairs.append((k.strip(), v.strip()))
+    return tuple(pairs)
+
+
+def get_session(cookies=None, proxy=None):
+    """Devuelve una Session compartida por hilo con pooling y reintentos.
+
+    Reutilizar la sesión mantiene vivas las conexiones TCP/TLS entre
+    peticiones del mismo worker en lugar de renegociar cada vez.
+    """
+    sess = getattr(_THREAD_LOCAL, "session", None)
+    if sess is None:
         sess = requests.Session()
-        if cookies:
-            cdict = {}
-            for part in cookies.split(";"):
-                if "=" in part:
-                    k, v = part.strip().split("=", 1)
-                    cdict[k.strip()] = v.strip()
-            sess.cookies.update(cdict)
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]
+            ),
+        )
+        sess.mount("http://", adapter)
+        sess.mount("https://", adapter)
+        _THREAD_LOCAL.session = sess
+    if cookies:
+        sess.cookies.update(dict(_parse_cookies(cookies)))
+    if proxy:
+        sess.proxies.update({"http": proxy, "https": proxy})
+    return sess
+
+
+def _get_httpx_client(proxy=None):
+    """Cliente httpx HTTP/2 compartido por hilo (requiere httpx instalado)."""
+    client = getattr(_THREAD_LOCAL, "httpx_client", None)
+    if client is None:
+        kwargs = dict(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32),
+            timeout=20,
+            follow_redirects=True,
+        )
         if proxy:
-            sess.proxies.update({"http": proxy, "https": proxy})
+            try:
+                client = httpx.Client(proxy=proxy, **kwargs)
+            except TypeError:
+                # httpx < 0.26 usaba el parámetro "proxies"
+                client = httpx.Client(proxies=proxy, **kwargs)
+        else:
+            client = httpx.Client(**kwargs)
+        _THREAD_LOCAL.httpx_client = client
+    return client
+
+
+def _stream_page_text(url, headers, timeout=20, cookies=None, proxy=None):
+    """Descarga el HTML por chunks y corta al primer indicio de URL de medios.
+
+    Escanea cada chunk (con un pequeño solape para matches partidos) con la
+    alternancia de medios; si aparece un hit deja de leer el resto de la
+    página. Si no hay hit, al terminar el bucle ya se tiene el HTML completo,
+    así que no hace falta segunda petición.
+    """
+    sess = get_session(cookies=cookies, proxy=proxy)
+    parts = []
+    tail = ""
+    with sess.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        r.encoding = r.encoding or "utf-8"
+        for chunk in r.iter_content(chunk_size=65536, decode_unicode=True):
+            if not chunk:
+                continue
+            parts.append(chunk)
+            if _ALL_MEDIA_RE.search(tail + chunk):
+                break
+            tail = chunk[-2048:]
+    return "".join(parts)
+
+
+def get_page_text(url, headers, timeout=20, cookies=None, proxy=None, use_http2=False):
+    try:
+        if use_http2 and httpx is not None:
+            client = _get_httpx_client(proxy=proxy)
+            req_headers = dict(headers or {})
+            if cookies:
+                req_headers["Cookie"] = cookies
+            r = client.get(url, headers=req_headers, timeout=timeout)
+            r.raise_for_status()
+            return True, r.text
+        sess = get_session(cookies=cookies, proxy=proxy)
         r = sess.get(url, headers=headers, timeout=timeout)
         r.raise_for_status()
         return True, r.text
@@ -250,86 +607,184 @@ def get_page_text(url, headers, timeout=20, cookies=None, proxy=None):
         return False, str(e)
 
 
-def find_media_urls_from_html(url, headers, cookies=None, proxy=None):
+async def _prefetch_pages_async(urls, headers, cookies=None, proxy=None, concurrency=8):
+    """Descarga el HTML de varias URLs concurrentemente con aiohttp.
+
+    Devuelve un dict url -> (ok, texto_o_error) que luego consumen los
+    workers, evitando un hilo bloqueado por cada fetch.
+    """
+    results = {}
+    sem = asyncio.Semaphore(concurrency)
+    req_headers = dict(headers or {})
+    if cookies:
+        req_headers["Cookie"] = cookies
+    timeout = aiohttp.ClientTimeout(total=20)
+    # Límite global y por host + caché DNS: muchas URLs del lote suelen
+    # apuntar al mismo dominio y no conviene martillearlo ni re-resolverlo
+    connector = aiohttp.TCPConnector(limit=64, limit_per_host=8, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(
+        headers=req_headers, timeout=timeout, connector=connector
+    ) as session:
+
+        async def _one(u):
+            async with sem:
+                try:
+                    async with session.get(u, proxy=proxy) as r:
+                        r.raise_for_status()
+                        results[u] = (True, await r.text())
+                except Exception as e:
+                    results[u] = (False, str(e))
+
+        await asyncio.gather(*(_one(u) for u in urls))
+    return results
+
+
+def prefetch_pages(urls, headers, cookies=None, proxy=None, concurrency=8):
+    """Versión síncrona de _prefetch_pages_async; dict vacío si no hay aiohttp."""
+    if not AIOHTTP_AVAILABLE or not urls:
+        return {}
+    try:
+        return asyncio.run(
+            _prefetch_pages_async(
+                urls, headers, cookies=cookies, proxy=proxy, concurrency=concurrency
+            )
+        )
+    except Exception as e:
+        print(f"[WARN] prefetch asíncrono fallo, se usará fetch por hilo: {e}")
+        return {}
+
+
+def find_media_urls_from_html(
+    url, headers, cookies=None, proxy=None, page_text=None, use_http2=False
+):
     """Intenta localizar URLs de vídeo/audio dentro del HTML de una página.
 
     Busca en etiquetas <video>/<source>, meta tags (og:video, twitter),
     scripts (incluyendo JSON-LD) y enlaces directos a ficheros de media.
-    Devuelve (lista_urls, mensaje_resumen).
+    Si `page_text` viene dado (p. ej. del prefetch asíncrono) se evita
+    volver a pedir la página. Devuelve (lista_urls, mensaje_resumen).
     """
-    ok, content_or_err = get_page_text(url, headers, cookies=cookies, proxy=proxy)
-    if not ok:
-        return [], f"error al obtener HTML: {content_or_err}"
-    text = content_or_err
-    soup = BeautifulSoup(text, "html.parser")
-    found = set()
-
-    for video in soup.find_all("video"):
-        if video.get("src"):
-            found.add(video.get("src"))
-        for src in video.find_all("source"):
-            if src.get("src"):
-                found.add(src.get("src"))
-
-    for meta in soup.find_all("meta"):
-        prop = (meta.get("property") or meta.get("name") or "").lower()
-        if prop in (
-            "og:video",
-            "og:video:url",
-            "og:video_secure_url",
-            "twitter:player:stream",
+    if page_text is not None:
+        text = page_text
+    elif not use_http2 or httpx is None:
+        try:
+            text = _stream_page_text(url, headers, cookies=cookies, proxy=proxy)
+        except Exception as e:
+            return [], f"error al obtener HTML: {e}"
+    else:
+        ok, content_or_err = get_page_text(
+            url, headers, cookies=cookies, proxy=proxy, use_http2=use_http2
+        )
+        if not ok:
+            return [], f"error al obtener HTML: {content_or_err}"
+        text = content_or_err
+
+    # Atajo para páginas triviales (errores, shells de redirección): si la
+    # respuesta es diminuta y no asoma ni un indicio de media, no merece
+    # pagar la construcción de un DOM
+    if (
+        len(text) < 4096
+        and "<video" not in text
+        and "og:video" not in text
+        and "twitter:player:stream" not in text
+        and "application/ld+json" not in text
+        and not _ALL_MEDIA_RE.search(text)
+    ):
+        return [], "no encontrado"
+
+    # dict usado como set ordenado por inserción; se une a la URL base una
+    # sola vez al insertar (la mayoría de hits de scripts ya son absolutos)
+    found = {}
+
+    def _add(u):
+        if u:
+            found[u if u.startswith("http") else urljoin(url, u)] = None
+
+    def _walk_ldjson(node):
+        # Recorrido iterativo con pila: sin un frame de Python por nivel de
+        # anidamiento, y solo se regexean las cadenas bajo claves objetivo
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if isinstance(n, dict):
+                for k, v in n.items():
+                    if isinstance(v, str):
+                        if k in _LDJSON_KEYS and LDJSON_EXT_RE.search(v):
+                            _add(v)
+                    elif isinstance(v, (dict, list)):
+                        stack.append(v)
+            elif isinstance(n, list):
+                stack.extend(n)
+
+    # Pasada única lineal sobre el HTML crudo: cubre los href= a ficheros de
+    # medios y las URLs absolutas incrustadas en scripts, sin construir DOM.
+    for m in _ALL_MEDIA_RE.finditer(text):
+        _add(m.group(1) or m.group(2))
+
+    # El árbol solo se usa para lo que el regex no ve: src relativos de
+    # <video>/<source>, metas og/twitter y bloques JSON-LD.
+    if LexborHTMLParser is not None:
+        # Camino rápido: selectolax (Lexbor, C) con selectores CSS
+        tree = LexborHTMLParser(text)
+        for el in tree.css("video[src], source[src]"):
+            _add(el.attributes.get("src"))
+        for el in tree.css(
+            'meta[property="og:video"], meta[property="og:video:url"], '
+            'meta[property="og:video_secure_url"], meta[name="twitter:player:stream"]'
         ):
-            if meta.get("content"):
-                found.add(meta.get("content"))
-
-    # JSON-LD (<script type="application/ld+json">) puede contener contentUrl/embedUrl
-    for script in soup.find_all("script", type="application/ld+json"):
-        raw_json = script.string or script.text or ""
+            content = el.attributes.get("content")
+            if content:
+                _add(content)
+        for el in tree.css('script[type="application/ld+json"]'):
+            # JSON-LD puede contener contentUrl/embedUrl
+            try:
+                data = _json_loads(el.text() or "")
+            except Exception:
+                continue
+            _walk_ldjson(data)
+    elif PARSER == "lxml":
+        # Camino intermedio: árbol lxml y selección por XPath en C, sin el
+        # bucle Python sobre cada <meta> que hace el fallback BS4
         try:
-            data = json.loads(raw_json)
+            root = lxml.html.fromstring(text)
         except Exception:
-            data = None
-
-        def _walk_ldjson(node):
-            if isinstance(node, dict):
-                for k in ("contentUrl", "embedUrl", "url", "video", "videoUrl"):
-                    v = node.get(k)
-                    if isinstance(v, str) and re.search(
-                        r"(m3u8|mp4|webm|mkv|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|mpd)(\?|$)",
-                        v,
-                        re.IGNORECASE,
-                    ):
-                        found.add(v)
-                for v in node.values():
-                    _walk_ldjson(v)
-            elif isinstance(node, list):
-                for item in node:
-                    _walk_ldjson(item)
-
-        if data is not None:
-            _walk_ldjson(data)
-
-    # Búsqueda genérica de URLs de medios dentro de scripts incrustados
-    for script in soup.find_all("script"):
-        txt = script.string or script.text or ""
-        for m in re.findall(
-            r'https?://[^\s"\'"<>]+(?:m3u8|mp4|webm|mkv|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|mpd)',
-            txt,
-            flags=re.IGNORECASE,
-        ):
-            found.add(m)
-
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if re.search(
-            r"\.(mp4|mkv|webm|mov|ogg|avi|flv|ts|m4v|3gp|mpeg|m3u8|mpd)(\?|$)",
-            href,
-            re.IGNORECASE,
-        ):
-            found.add(href)
-
-    full = [urljoin(url, u) for u in found]
-    return list(dict.fromkeys(full)), "OK" if full else "no encontrado"
+            root = None
+        if root is not None:
+            for el in root.xpath("//video[@src] | //source[@src]"):
+                _add(el.get("src"))
+            for el in root.xpath(_META_XPATH):
+                if el.get("content"):
+                    _add(el.get("content"))
+            for el in root.xpath('//script[@type="application/ld+json"]'):
+                try:
+                    data = _json_loads(el.text or "")
+                except Exception:
+                    continue
+                _walk_ldjson(data)
+    else:
+        # Fallback: BeautifulSoup limitado a las etiquetas que miramos,
+        # en una sola pasada sobre el árbol despachando según la etiqueta
+        soup = BeautifulSoup(text, PARSER, parse_only=_MEDIA_STRAINER)
+        for el in soup.descendants:
+            name = getattr(el, "name", None)
+            if name in ("video", "source"):
+                if el.get("src"):
+                    _add(el.get("src"))
+            elif name == "meta":
+                prop = (el.get("property") or el.get("name") or "").lower()
+                if prop in META_VIDEO_PROPS:
+                    if el.get("content"):
+                        _add(el.get("content"))
+            elif name == "script" and el.get("type") == "application/ld+json":
+                # JSON-LD puede contener contentUrl/embedUrl
+                try:
+                    data = _json_loads(el.string or el.text or "")
+                except Exception:
+                    continue
+                _walk_ldjson(data)
+
+    full = list(found)
+    return full, "OK" if full else "no encontrado"
 
 
 # -------------------
@@ -337,37 +792,115 @@ def find_media_urls_from_html(url, headers, cookies=None, proxy=None):
 # -------------------
 
 
+def _download_ranged_file(
+    url, outpath, headers, session, total, connections=8, timeout=30, bucket=None
+):
+    """Descarga un fichero en N rangos HTTP paralelos escribiendo con pwrite.
+
+    Requiere que el servidor soporte Accept-Ranges y que el tamaño sea
+    conocido. Cada hilo pide su rango y escribe en el offset que le toca.
+    """
+    fd = os.open(outpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, total)
+        part = total // connections
+        ranges = []
+        for i in range(connections):
+            a = i * part
+            b = total - 1 if i == connections - 1 else (i + 1) * part - 1
+            ranges.append((a, b))
+        with tqdm(
+            total=total, unit="B", unit_scale=True, desc=os.path.basename(outpath)
+        ) as pbar:
+
+            def _fetch(rng):
+                a, b = rng
+                h = dict(headers or {})
+                h["Range"] = f"bytes={a}-{b}"
+                with session.get(url, headers=h, stream=True, timeout=timeout) as r:
+                    r.raise_for_status()
+                    off = a
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        if chunk:
+                            if bucket:
+                                bucket.consume(len(chunk))
+                            os.pwrite(fd, chunk, off)
+                            off += len(chunk)
+                            pbar.update(len(chunk))
+
+            with ThreadPoolExecutor(max_workers=connections) as ex:
+                list(ex.map(_fetch, ranges))
+    finally:
+        os.close(fd)
+
+
 def download_direct_file(
-    url, outpath, headers, cookies=None, proxy=None, max_retries=3, timeout=30
+    url, outpath, headers, cookies=None, proxy=None, max_retries=3, timeout=30,
+    connections=1, bucket=None,
 ):
     ensure_dir(os.path.dirname(outpath) or ".")
-    session = requests.Session()
-    if cookies:
-        cdict = {}
-        for part in cookies.split(";"):
-            if "=" in part:
-                k, v = part.strip().split("=", 1)
-                cdict[k.strip()] = v.strip()
-        session.cookies.update(cdict)
-    if proxy:
-        session.proxies.update({"http": proxy, "https": proxy})
+    session = get_session(cookies=cookies, proxy=proxy)
     headers = headers or {}
+
+    # Camino paralelo: solo para ficheros grandes en servidores con rangos
+    if connections > 1:
+        try:
+            head = session.head(
+                url, headers=headers, allow_redirects=True, timeout=timeout
+            )
+            total = int(head.headers.get("content-length", 0) or 0)
+            if (
+                head.headers.get("accept-ranges", "").lower() == "bytes"
+                and total > 16 * 1024 * 1024
+            ):
+                _download_ranged_file(
+                    url,
+                    outpath,
+                    headers,
+                    session,
+                    total,
+                    connections=connections,
+                    timeout=timeout,
+                    bucket=bucket,
+                )
+                return True, f"descargado directo ({connections} rangos): {outpath}"
+        except Exception as e:
+            print(f"[WARN] descarga por rangos fallo, se usa un solo stream: {e}")
+
     last_err = None
     for attempt in range(1, max_retries + 1):
         try:
             with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
                 r.raise_for_status()
                 total = int(r.headers.get("content-length", 0) or 0)
-                with open(outpath, "wb") as f, tqdm(
-                    total=total,
-                    unit="B",
-                    unit_scale=True,
-                    desc=os.path.basename(outpath),
-                ) as pbar:
-                    for chunk in r.iter_content(chunk_size=1024 * 32):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
+                # fd crudo + chunks de 1 MiB: evita el buffer intermedio de
+                # Python y reduce drásticamente las iteraciones del bucle
+                fd = os.open(outpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    with tqdm(
+                        total=total,
+                        unit="B",
+                        unit_scale=True,
+                        desc=os.path.basename(outpath),
+                    ) as pbar:
+                        pending = 0
+                        for chunk in r.iter_content(chunk_size=1 << 20):
+                            if chunk:
+                                if bucket:
+                                    bucket.consume(len(chunk))
+                                os.write(fd, chunk)
+                                pending += len(chunk)
+                                # actualizar la barra como mucho cada 512 KiB
+                                if pending >= 512 * 1024:
+                                    pbar.update(pending)
+                                    pending = 0
+                        if pending:
+                            pbar.update(pending)
+                    if hasattr(os, "posix_fadvise"):
+                        # no contaminar el page cache con el fichero descargado
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
             return True, f"descargado directo: {outpath}"
         except Exception as e:
             last_err = str(e)
@@ -375,16 +908,120 @@ def download_direct_file(
     return False, f"error descarga directa tras {max_retries} intentos: {last_err}"
 
 
+def _download_hls_segments_async(
+    m3u8_url, outpath, headers=None, cookies=None, proxy=None, concurrency=16
+):
+    """Descarga los segmentos de un playlist HLS en paralelo con aiohttp.
+
+    Parsea el .m3u8 en Python, baja N segmentos a la vez a un directorio
+    temporal y deja que ffmpeg solo haga el mux final (-f concat -c copy).
+    Devuelve (ok, mensaje).
+    """
+    import tempfile
+
+    req_headers = dict(headers or {})
+    if cookies:
+        req_headers["Cookie"] = cookies
+
+    # El manifest va por la sesión compartida, que ya monta el proxy: si no,
+    # un usuario con proxy obligatorio filtraba esta petición en directo
+    session = get_session(cookies=cookies, proxy=proxy)
+    resp = session.get(m3u8_url, headers=req_headers, timeout=30)
+    resp.raise_for_status()
+    playlist = m3u8_lib.loads(resp.text, uri=m3u8_url)
+    if playlist.playlists:
+        # Master playlist: elegir la variante de mayor ancho de banda
+        best = max(
+            playlist.playlists,
+            key=lambda p: (p.stream_info.bandwidth or 0) if p.stream_info else 0,
+        )
+        return _download_hls_segments_async(
+            urljoin(m3u8_url, best.uri),
+            outpath,
+            headers=headers,
+            cookies=cookies,
+            proxy=proxy,
+            concurrency=concurrency,
+        )
+    # Manifests cifrados o live: mejor el demuxer de ffmpeg, que sabe de
+    # claves AES y de playlists que siguen creciendo
+    if any(k is not None for k in playlist.keys or []) or playlist.session_keys:
+        return False, "manifest cifrado: se delega en ffmpeg"
+    if not playlist.is_endlist:
+        return False, "manifest live (sin ENDLIST): se delega en ffmpeg"
+
+    seg_urls = [urljoin(m3u8_url, seg.uri) for seg in playlist.segments]
+    if not seg_urls:
+        return False, "playlist HLS sin segmentos"
+
+    async def _fetch_all(tmpdir):
+        sem = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(
+            connector=connector, headers=req_headers
+        ) as session:
+
+            async def _fetch(i, seg_url):
+                async with sem:
+                    async with session.get(
+                        seg_url, proxy=proxy, timeout=aiohttp.ClientTimeout(total=120)
+                    ) as r:
+                        r.raise_for_status()
+                        data = await r.read()
+                with open(os.path.join(tmpdir, f"{i:06d}.ts"), "wb") as f:
+                    f.write(data)
+
+            await asyncio.gather(*(_fetch(i, u) for i, u in enumerate(seg_urls)))
+
+    with tempfile.TemporaryDirectory(prefix="hls_") as tmpdir:
+        asyncio.run(_fetch_all(tmpdir))
+        list_path = os.path.join(tmpdir, "list.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for i in range(len(seg_urls)):
+                f.write(f"file '{os.path.join(tmpdir, f'{i:06d}.ts')}'\n")
+        cmd = ["ffmpeg", "-y", "-loglevel", "error", "-stats", "-threads", "0"]
+        cmd += ["-f", "concat", "-safe", "0", "-i", list_path]
+        cmd += ["-c", "copy", "-movflags", "+faststart", outpath]
+        with _FFMPEG_SEM:
+            code, _out, err = run_cmd(cmd, timeout=600)
+        if code == 0:
+            return True, f"HLS paralelo OK ({len(seg_urls)} segmentos): {outpath}"
+        # decodificar solo en el camino de error
+        err_text = err.decode("utf-8", errors="ignore")
+        return False, (
+            f"ffmpeg concat fallo: {err_text.splitlines()[-1] if err_text else ''}"
+        )
+
+
 def download_hls_with_ffmpeg(
-    m3u8_url, outpath, proxy=None, cookies=None, headers=None, timeout=300
+    m3u8_url, outpath, proxy=None, cookies=None, headers=None, timeout=300,
+    concurrency=16, hwaccel=False,
 ):
     """Descarga un stream HLS/DASH/manifest con ffmpeg copiando el contenedor.
 
+    Si aiohttp y m3u8 están instalados y la URL es un .m3u8, los segmentos
+    se bajan en paralelo y ffmpeg solo hace el mux; en caso contrario (o si
+    el camino paralelo falla) se usa ffmpeg directamente contra el manifest.
     Admite proxy y puede inyectar cabeceras (User-Agent, Cookie, Referer, ...)
     para sitios que las requieren.
     """
     ensure_dir(os.path.dirname(outpath) or ".")
 
+    if HLS_ASYNC_AVAILABLE and M3U8_RE.search(m3u8_url):
+        try:
+            ok, msg = _download_hls_segments_async(
+                m3u8_url,
+                outpath,
+                headers=headers,
+                cookies=cookies,
+                proxy=proxy,
+                concurrency=concurrency,
+            )
+            if ok:
+                return ok, msg
+        except Exception as e:
+            print(f"[WARN] descarga HLS paralela fallo, probando ffmpeg directo: {e}")
+
     extra_headers = []
     if headers:
         for k, v in headers.items():
@@ -397,19 +1034,27 @@ def download_hls_with_ffmpeg(
         # ffmpeg espera cabeceras separadas por CRLF
         header_arg = "\r\n".join(extra_headers)
 
-    cmd = ["ffmpeg", "-y"]
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-stats", "-threads", "0"]
+    if hwaccel:
+        # opt-in: solo ayuda si el manifest fuerza transcodificación
+        cmd += ["-hwaccel", "auto"]
     if header_arg:
         cmd += ["-headers", header_arg]
-    cmd += ["-i", m3u8_url, "-c", "copy", outpath]
+    cmd += ["-i", m3u8_url, "-c", "copy"]
+    # faststart deja el moov al principio; aac_adtstoasc es el bitstream
+    # filter estándar para pasar audio AAC de TS a contenedor MP4
+    cmd += ["-movflags", "+faststart", "-bsf:a", "aac_adtstoasc", outpath]
     env = os.environ.copy()
     if proxy:
         env["http_proxy"] = proxy
         env["https_proxy"] = proxy
-    code, out, err = run_cmd(cmd, timeout=timeout, env=env)
+    with _FFMPEG_SEM:
+        code, _out, err = run_cmd(cmd, timeout=timeout, env=env)
     if code == 0:
         return True, f"ffmpeg OK: {outpath}"
-    else:
-        return False, f"ffmpeg fallo: {err.splitlines()[-1] if err else out}"
+    # decodificar solo en el camino de error
+    err_text = err.decode("utf-8", errors="ignore")
+    return False, f"ffmpeg fallo: {err_text.splitlines()[-1] if err_text else ''}"
 
 
 # -------------------
@@ -417,21 +1062,42 @@ def download_hls_with_ffmpeg(
 # -------------------
 
 
-def capture_with_selenium(url, wait_seconds=8, headless=True, headers=None, proxy=None):
-    """Usa selenium-wire para capturar peticiones de red y localizar streams.
+_DRIVER_TLS = threading.local()
 
-    Es útil cuando la página genera las URLs de vídeo vía JavaScript y no se
-    ven en el HTML estático.
+
+def _quit_selenium_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+def _get_selenium_driver(headless=True, proxy=None):
+    """Devuelve el driver selenium-wire del hilo, creándolo una sola vez.
+
+    Arrancar Chrome cuesta segundos y ChromeDriverManager toca disco en
+    cada install(); reutilizar el driver entre URLs amortiza ambos costes
+    en un lote. Se registra atexit para cerrarlo al terminar el proceso.
     """
-    if not SELENIUM_WIRE_AVAILABLE:
-        return [], "selenium-wire no instalado"
+    driver = getattr(_DRIVER_TLS, "driver", None)
+    if driver is not None:
+        return driver
     options = webdriver.ChromeOptions()
     if headless:
         options.add_argument("--headless=new")
         options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    selenium_opts = {}
+    selenium_opts = {
+        # Evitar el coste de capturar/decodificar tráfico irrelevante
+        "disable_encoding": True,
+        "connection_keep_alive": True,
+        "exclude_hosts": [
+            "*.google-analytics.com",
+            "*.doubleclick.net",
+            "*.googletagmanager.com",
+        ],
+    }
     if proxy:
         selenium_opts["proxy"] = {
             "http": proxy,
@@ -443,31 +1109,61 @@ def capture_with_selenium(url, wait_seconds=8, headless=True, headers=None, prox
         options=options,
         seleniumwire_options=selenium_opts,
     )
+    _DRIVER_TLS.driver = driver
+    atexit.register(_quit_selenium_driver, driver)
+    return driver
+
+
+def capture_with_selenium(url, wait_seconds=8, headless=True, headers=None, proxy=None):
+    """Usa selenium-wire para capturar peticiones de red y localizar streams.
+
+    Es útil cuando la página genera las URLs de vídeo vía JavaScript y no se
+    ven en el HTML estático.
+    """
+    if not SELENIUM_WIRE_AVAILABLE:
+        return [], "selenium-wire no instalado"
+    driver = _get_selenium_driver(headless=headless, proxy=proxy)
     found = set()
     try:
-        driver.scopes = [".*"]
+        # Vaciar las capturas de la URL anterior antes de navegar
+        del driver.requests
+        # Restringir la captura a las URLs que nos interesan antes de navegar
+        driver.scopes = [r".*\.m3u8", r".*\.mp4", r".*/manifest", r".*/playlist"]
         driver.get(url)
-        time.sleep(wait_seconds)
-        for req in driver.requests:
+        # Esperar solo hasta que aparezca el stream en vez de dormir siempre
+        # los wait_seconds completos; si no aparece, seguimos con lo capturado.
+        try:
+            req = driver.wait_for_request(
+                r"\.m3u8|/manifest|/playlist", timeout=wait_seconds
+            )
+            found.add(req.url)
+        except Exception:
+            pass
+        for req in driver.iter_requests():
             if req.response:
                 u = req.url
-                if re.search(
-                    r"\.m3u8(\?|$)|\.mp4(\?|$)|/playlist/|/manifest", u, re.IGNORECASE
-                ):
+                if CAPTURE_RE.search(u):
                     found.add(u)
-                ct = (
-                    req.response.headers.get("Content-Type", "") if req.response else ""
-                )
+                    if M3U8_RE.search(u):
+                        # Con el manifest HLS ya no hace falta seguir iterando
+                        break
+                    continue
+                ct = req.response.headers.get("Content-Type", "")
                 if "application/vnd.apple.mpegurl" in ct or "video" in ct:
                     found.add(u)
-        srcs, _ = find_media_urls_from_html(url, headers or {"User-Agent": DEFAULT_UA})
-        for s in srcs:
-            found.add(s)
-    finally:
+        # Reutilizar el HTML ya renderizado por el navegador en vez de
+        # volver a pedir y parsear la página con requests
         try:
-            driver.quit()
+            rendered = driver.page_source
         except Exception:
-            pass
+            rendered = None
+        srcs, _ = find_media_urls_from_html(
+            url, headers or {"User-Agent": DEFAULT_UA}, page_text=rendered
+        )
+        for s in srcs:
+            found.add(s)
+    except Exception as e:
+        return list(found), f"selenium fallo: {e}"
     return list(found), "OK" if found else "no encontrado"
 
 
@@ -476,6 +1172,20 @@ def capture_with_selenium(url, wait_seconds=8, headless=True, headers=None, prox
 # -------------------
 
 
+def _probe_media_url(u, session, headers=None, timeout=10):
+    """Sondea un candidato con un HEAD barato antes de gastarle una descarga.
+
+    Devuelve (vivo, content_length). Cualquier fallo cuenta como muerto;
+    quien llama decide si aun así reintenta sin filtro.
+    """
+    try:
+        r = session.head(u, headers=headers, allow_redirects=True, timeout=timeout)
+        size = int(r.headers.get("Content-Length") or 0)
+        return r.status_code < 400, size
+    except Exception:
+        return False, 0
+
+
 def parse_and_download(url, outdir, opts):
     """Pipeline de parseo HTML + descarga directa/HLS para una URL.
 
@@ -487,8 +1197,15 @@ def parse_and_download(url, outdir, opts):
     headers = {"User-Agent": opts.get("user_agent") or DEFAULT_UA}
     if opts.get("headers"):
         headers.update(opts.get("headers"))
+    cached = (opts.get("_page_cache") or {}).get(url)
+    page_text = cached[1] if cached and cached[0] else None
     media_urls, msg = find_media_urls_from_html(
-        url, headers, cookies=opts.get("cookie_string"), proxy=opts.get("proxy")
+        url,
+        headers,
+        cookies=opts.get("cookie_string"),
+        proxy=opts.get("proxy"),
+        page_text=page_text,
+        use_http2=opts.get("http2", False),
     )
     if not media_urls and opts.get("use_selenium"):
         cap_urls, msg2 = capture_with_selenium(
@@ -503,32 +1220,56 @@ def parse_and_download(url, outdir, opts):
     if not media_urls:
         return False, f"No se encontraron recursos directos: {msg}"
 
-    # Primero, intentar manifests/streams (HLS/DASH)
+    # Clasificar los candidatos en una sola pasada: manifests vs directos
+    hls_urls, direct_urls = [], []
     for m in media_urls:
-        if re.search(r"\.(m3u8|mpd)(\?|$)", m, re.IGNORECASE) or re.search(
-            r"/manifest(\?|$)|/playlist(\?|$)", m, re.IGNORECASE
-        ):
-            outname = safe_filename(Path(urlparse(m).path).name or "stream")
-            outpath = os.path.join(outdir, outname)
-            if not outpath.lower().endswith(".mp4"):
-                outpath = outpath + ".mp4"
-            ok, info = download_hls_with_ffmpeg(
-                m,
-                outpath,
-                proxy=opts.get("proxy"),
-                cookies=opts.get("cookie_string"),
-                headers=headers,
-            )
-            if ok:
-                return True, info
+        (hls_urls if MANIFEST_RE.search(m) else direct_urls).append(m)
+
+    # Sondeo HEAD: descartar candidatos muertos antes de lanzar ffmpeg (que
+    # tarda segundos en rendirse ante un 404) y ordenar los directos por
+    # tamaño descendente, que suele correlacionar con la mayor calidad.
+    # Si el filtro lo mata todo (hay servidores que rechazan HEAD), se
+    # conserva la lista original y que lo resuelva la descarga.
+    probe_session = get_session(
+        cookies=opts.get("cookie_string"), proxy=opts.get("proxy")
+    )
+    alive = [
+        m for m in hls_urls if _probe_media_url(m, probe_session, headers)[0]
+    ]
+    hls_urls = alive or hls_urls
+
+    sized = []
+    for m in direct_urls:
+        is_alive, size = _probe_media_url(m, probe_session, headers)
+        if is_alive:
+            sized.append((size, m))
+    if sized:
+        sized.sort(key=lambda t: t[0], reverse=True)
+        direct_urls = [m for _, m in sized]
+
+    # Primero, intentar manifests/streams (HLS/DASH)
+    for m in hls_urls:
+        outname = safe_filename(Path(_urlparse(m).path).name or "stream")
+        outpath = os.path.join(outdir, outname)
+        if not outpath.lower().endswith(".mp4"):
+            outpath = outpath + ".mp4"
+        ok, info = download_hls_with_ffmpeg(
+            m,
+            outpath,
+            proxy=opts.get("proxy"),
+            cookies=opts.get("cookie_string"),
+            headers=headers,
+            concurrency=opts.get("hls_concurrency", 16),
+            hwaccel=opts.get("hwaccel", False),
+        )
+        if ok:
+            return True, info
 
     # Fallback: descarga directa de ficheros de vídeo conocidos
-    for m in media_urls:
-        full = m if bool(urlparse(m).netloc) else urljoin(url, m)
-        basename = Path(urlparse(full).path).name or "video"
-        if not re.search(
-            r"\.(mp4|mkv|webm|mov|ogg|avi|flv|ts|m4v|3gp|mpeg)", basename, re.IGNORECASE
-        ):
+    for m in direct_urls:
+        full = m if bool(_urlparse(m).netloc) else urljoin(url, m)
+        basename = Path(_urlparse(full).path).name or "video"
+        if not DIRECT_EXT_RE.search(basename):
             basename = basename + ".mp4"
         outpath = os.path.join(outdir, safe_filename(basename))
         ok, info = download_direct_file(
@@ -538,6 +1279,8 @@ def parse_and_download(url, outdir, opts):
             cookies=opts.get("cookie_string"),
             proxy=opts.get("proxy"),
             max_retries=opts.get("retries", 3),
+            connections=opts.get("connections_per_file", 1),
+            bucket=opts.get("_bucket"),
         )
         if ok:
             return True, info
@@ -562,11 +1305,30 @@ def worker(url, outdir, opts):
 
     target_outdir = outdir
     if opts.get("by_site"):
-        domain = urlparse(url).netloc or "unknown_site"
+        domain = _urlparse(url).netloc or "unknown_site"
         domain = safe_filename(domain)
         target_outdir = os.path.join(outdir, domain)
 
     ensure_dir(target_outdir)
+
+    # 0) Atajo: enlaces directos a ficheros de vídeo no necesitan yt-dlp
+    if _is_direct_media(url) and not opts.get("only_audio"):
+        basename = Path(_urlparse(url).path).name or "video"
+        outpath = os.path.join(target_outdir, safe_filename(basename))
+        ok, msg = download_direct_file(
+            url,
+            outpath,
+            headers={"User-Agent": opts.get("user_agent") or DEFAULT_UA},
+            cookies=opts.get("cookie_string"),
+            proxy=opts.get("proxy"),
+            max_retries=opts.get("retries", 3),
+            connections=opts.get("connections_per_file", 1),
+            bucket=opts.get("_bucket"),
+        )
+        if ok:
+            return (url, True, msg)
+        # si la descarga directa falla, continuar con el pipeline normal
+
     # 1) Try yt-dlp (a menos que lo desactives)
     if not opts.get("no_yt"):
         try:
@@ -585,71 +1347,12 @@ def worker(url, outdir, opts):
             print(f"[WARN] yt-dlp excepción para {url}: {e}")
 
     # 2) parse HTML + direct download + ffmpeg HLS + selenium fallback
+    # (el bloqueo por algoritmo desconocido ya quedó detectado en el paso 1
+    # gracias al logger capturado; el fallback de Selenium vive aquí dentro)
     ok, msg = parse_and_download(url, target_outdir, opts)
     if ok:
         return (url, True, msg)
 
-    # 3) intentar yt-dlp via subprocess para capturar stderr completo y decidir estrategia
-    if not opts.get("no_yt"):
-        try:
-            cmd = [
-                "yt-dlp",
-                "--no-warnings",
-                "-f",
-                opts.get("format", "bestvideo+bestaudio/best"),
-                url,
-            ]
-            if opts.get("cookiefile"):
-                cmd += ["--cookies", opts.get("cookiefile")]
-            proc = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=300,
-            )
-            stderr = proc.stderr or proc.stdout
-            block = yt_dlp_detects_block(stderr)
-            if block == "PIRACY_BLOCK":
-                return (
-                    url,
-                    False,
-                    "yt-dlp bloquea este sitio por política (Piracy). No se puede forzar.",
-                )
-            if block == "UNKNOWN_ALG":
-                if opts.get("use_selenium"):
-                    cap_urls, capmsg = capture_with_selenium(
-                        url,
-                        wait_seconds=opts.get("selenium_wait", 8),
-                        headless=opts.get("selenium_headless", True),
-                        headers={"User-Agent": opts.get("user_agent")},
-                        proxy=opts.get("proxy"),
-                    )
-                    if cap_urls:
-                        for m in cap_urls:
-                            if re.search(r"\.m3u8(\?|$)", m, re.IGNORECASE):
-                                outname = safe_filename(
-                                    Path(urlparse(m).path).name or "stream"
-                                )
-                                outpath = os.path.join(target_outdir, outname + ".mp4")
-                                ok2, info2 = download_hls_with_ffmpeg(
-                                    m,
-                                    outpath,
-                                    proxy=opts.get("proxy"),
-                                    cookies=opts.get("cookie_string"),
-                                )
-                            else:
-                                ok2, info2 = parse_and_download(m, target_outdir, opts)
-                            if ok2:
-                                return (url, True, f"Selenium fallback OK: {info2}")
-                return (
-                    url,
-                    False,
-                    "yt-dlp error de algoritmo desconocido; se intentó fallback sin éxito.",
-                )
-        except Exception:
-            pass
-
     return (url, False, f"Todas las estrategias fallaron: {msg}")
 
 
@@ -705,6 +1408,28 @@ def main():
     ap.add_argument(
         "--retries", type=int, default=3, help="Reintentos para descargas directas."
     )
+    ap.add_argument(
+        "--hls-concurrency",
+        type=int,
+        default=16,
+        help="Segmentos HLS descargados en paralelo (requiere aiohttp y m3u8).",
+    )
+    ap.add_argument(
+        "--connections-per-file",
+        type=int,
+        default=8,
+        help="Conexiones paralelas por fichero directo grande (Range requests).",
+    )
+    ap.add_argument(
+        "--http2",
+        action="store_true",
+        help="Usar httpx con HTTP/2 para el fetch de páginas (requiere httpx).",
+    )
+    ap.add_argument(
+        "--hwaccel",
+        action="store_true",
+        help="Pasar -hwaccel auto a ffmpeg (útil solo si hay transcodificación).",
+    )
     ap.add_argument(
         "--user-agent", default=DEFAULT_UA, help="User-Agent para requests."
     )
@@ -738,6 +1463,11 @@ def main():
     outdir = normalize_outdir_for_os(args.outdir)
     ensure_dir(outdir)
 
+    # Token bucket global: aplica el --ratelimit también a las descargas
+    # directas/HLS, no solo a yt-dlp, compartido entre todos los workers.
+    rate_bps = parse_rate_limit(args.ratelimit)
+    bucket = TokenBucket(rate_bps) if rate_bps else None
+
     opts = {
         "no_yt": args.no_yt,
         "use_selenium": args.use_selenium,
@@ -752,50 +1482,111 @@ def main():
         "only_audio": args.only_audio,
         "audio_format": args.audio_format,
         "retries": args.retries,
+        "hls_concurrency": args.hls_concurrency,
+        "connections_per_file": args.connections_per_file,
+        "http2": args.http2,
+        "hwaccel": args.hwaccel,
         "user_agent": args.user_agent,
         "by_site": args.by_site,
         "headers": None,
+        "_bucket": bucket,
     }
 
     if args.url:
         urls = [args.url.strip()]
     else:
         with open(args.input, "r", encoding="utf-8") as f:
-            urls = [
-                sanitize_url(line.strip())
-                for line in f
-                if line.strip() and not line.strip().startswith("#")
-            ]
-
-    results = []
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futures = {ex.submit(worker, url, outdir, opts): url for url in urls}
-        for fut in as_completed(futures):
-            url = futures[fut]
-            try:
-                u, ok, msg = fut.result()
-                results.append((u, ok, msg))
-                status = "OK" if ok else "FAIL"
-                print(f"[{status}] {u} -> {msg}")
-            except Exception as e:
-                results.append((url, False, f"Excepción: {e}"))
-                print(f"[ERROR] {url} -> {e}")
-
-    ok_count = sum(1 for r in results if r[1])
-    print(f"\nResumen: {ok_count}/{len(results)} descargados. Carpeta: {outdir}")
+            # dedupe por forma canónica preservando el orden de aparición
+            seen = set()
+            urls = []
+            for line in f:
+                stripped = line.strip()
+                if not stripped or stripped.startswith("#"):
+                    continue
+                u = sanitize_url(stripped)
+                key = canon_url(u)
+                if key in seen:
+                    continue
+                seen.add(key)
+                urls.append(u)
+
+    # Prefetch asíncrono del HTML (si aiohttp está disponible): los workers
+    # reutilizan el texto cacheado y no bloquean un hilo por página.
+    if not args.no_yt:
+        # Con yt-dlp activo muchas URLs nunca llegan al parseo HTML
+        opts["_page_cache"] = {}
+    else:
+        opts["_page_cache"] = prefetch_pages(
+            urls,
+            {"User-Agent": args.user_agent},
+            cookies=args.cookie_string,
+            proxy=args.proxy,
+            concurrency=max(args.workers, 8),
+        )
 
+    # Log CSV incremental: cada fila se escribe (y flushea) al completarse
+    # su URL, así el log sobrevive a cortes y no acumula resultados en RAM.
+    csvf = csv_writer = None
     if args.log:
         try:
-            import csv
-
-            with open(args.log, "w", newline="", encoding="utf-8") as csvf:
-                w = csv.writer(csvf)
-                w.writerow(["url", "ok", "message"])
-                for r in results:
-                    w.writerow([r[0], "OK" if r[1] else "FAIL", r[2]])
-            print(f"Log guardado en {args.log}")
+            csvf = open(args.log, "w", newline="", encoding="utf-8")
+            csv_writer = csv.writer(csvf)
+            csv_writer.writerow(["url", "ok", "message"])
+            csvf.flush()
         except Exception as e:
-            print(f"No se pudo guardar log: {e}")
+            print(f"No se pudo abrir log: {e}")
+            csvf = csv_writer = None
+    log_lock = threading.Lock()
+
+    # Las URLs se agrupan por host y cada host queda fijado a un solo worker:
+    # así un hilo reutiliza las conexiones keep-alive de su Session thread-local
+    # (un handshake TCP+TLS por host y worker) en vez de repartir el mismo host
+    # entre todos los hilos.
+    n_buckets = max(1, min(args.workers, len(urls)))
+    buckets = [[] for _ in range(n_buckets)]
+    for url in urls:
+        netloc = _urlparse(url).netloc
+        buckets[hash(netloc) % n_buckets].append(url)
+    buckets = [b for b in buckets if b]
+
+    ok_count = 0
+    total = 0
+    counters_lock = threading.Lock()
+
+    def _report(u, ok, msg):
+        nonlocal ok_count, total
+        status = "OK" if ok else "FAIL"
+        print(f"[{status}] {u} -> {msg}")
+        with counters_lock:
+            total += 1
+            if ok:
+                ok_count += 1
+        if csv_writer:
+            with log_lock:
+                csv_writer.writerow([u, status, msg])
+                csvf.flush()
+
+    def _worker_loop(batch):
+        # Drena secuencialmente las URLs de su bucket (mismo conjunto de hosts)
+        for url in batch:
+            try:
+                u, ok, msg = worker(url, outdir, opts)
+            except Exception as e:
+                u, ok, msg = url, False, f"Excepción: {e}"
+            _report(u, ok, msg)
+
+    # Con un archivo vacío (o solo comentarios) no hay buckets; el executor
+    # no admite max_workers=0, así que se salta directo al resumen 0/0
+    if buckets:
+        with ThreadPoolExecutor(max_workers=len(buckets)) as ex:
+            for fut in as_completed([ex.submit(_worker_loop, b) for b in buckets]):
+                fut.result()
+
+    if csvf:
+        csvf.close()
+        print(f"Log guardado en {args.log}")
+
+    print(f"\nResumen: {ok_count}/{total} descargados. Carpeta: {outdir}")
 
 
 if __name__ == "__main__":
@@ -5,20 +5,53 @@
 # Características principales:
 # - Acepta URLs individuales, playlists y listas de URLs.
 # - Descarga siempre el mejor audio disponible.
-# - Convierte a audio (MP3 por defecto) en la mejor calidad posible.
+# - Extrae el audio (m4a por defecto, sin re-codificar; MP3 opcional vía
+#   AUDIO_FORMAT=mp3) en la mejor calidad posible.
 # - Intenta escribir metadatos (título, artista, álbum) y portada.
 # - Guarda un .info.json por archivo con metadatos extendidos
-#   (incluyendo letras si el extractor las expone).
+#   (incluyendo letras si el extractor las expone); SAVE_SIDECARS=0 lo apaga.
 #
 # Requisitos:
 #   pip install yt-dlp
 #   ffmpeg disponible en PATH
 
+import json
+import mmap
 import os
+import re
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 from yt_dlp import YoutubeDL
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+try:
+    # Transporte con curl_cffi (si está instalado): una conexión HTTP/2
+    # multiplexa las llamadas de metadatos en vez de pagar un handshake
+    # TCP+TLS por petición
+    import curl_cffi  # noqa: F401
+
+    CURL_CFFI_AVAILABLE = True
+except ImportError:
+    CURL_CFFI_AVAILABLE = False
+
+try:
+    # Con mutagen la portada se incrusta reescribiendo solo las etiquetas
+    # (ID3/MP4), sin el re-mux de ffmpeg; yt-dlp ya lo usa solo para m4a,
+    # y aquí lo aprovechamos también para MP3 con un postprocesador propio
+    from mutagen.id3 import APIC, ID3
+
+    from yt_dlp.postprocessor import PostProcessor
+
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
+
+# Resuelto una sola vez al importar; los derivados reutilizan el mismo objeto
+BASE_DIR = Path(__file__).resolve().parent
 
 # ----------------- CONFIGURACIÓN -----------------
 # 1) URLs a descargar (videos o playlists de YouTube / YouTube Music)
@@ -32,103 +65,397 @@ urls = [
 
 # 2) Archivo de texto con URLs (una por línea).
 #    Por defecto, se usa links_audio.txt en la misma carpeta que este script.
-urls_from_file = os.path.join(BASE_DIR, "links_audio.txt")
+urls_from_file = BASE_DIR / "links_audio.txt"
 
 # 3) Carpeta de destino (cambia la ruta a la que prefieras).
 #    Por defecto, una subcarpeta ./Descargas junto al script.
-output_folder = os.path.join(BASE_DIR, "Descargas")
+output_folder = BASE_DIR / "Descargas"
 
 # 4) Formato de salida y calidad
-#    - audio_format: "mp3" por defecto. Para máxima calidad es recomendable
-#      usar "m4a" (suele implicar menos pérdida a partir del stream original).
+#    - audio_format: "m4a" por defecto. El mejor audio de YouTube ya suele ser
+#      AAC en contenedor m4a, así que la "extracción" es una copia de stream:
+#      sin re-codificar (sin pérdida extra) y casi gratis en CPU.
+#    - Exporta AUDIO_FORMAT=mp3 si de verdad necesitas MP3 (re-codifica).
 #    - mp3_quality: sólo aplica cuando audio_format es "mp3".
-audio_format = "mp3"
+audio_format = os.environ.get("AUDIO_FORMAT", "m4a").lower()
 mp3_quality = "320"  # "192", "256" o "320" para MP3
+
+# 5) Hilos de descarga en paralelo: mientras un hilo convierte con ffmpeg,
+#    otros siguen descargando. 4 va bien para la mayoría de conexiones.
+download_workers = 4
+
+# 6) Sidecars: .info.json y thumbnail junto a cada audio. Exporta
+#    SAVE_SIDECARS=0 para ahorrarte esas escrituras (la portada se sigue
+#    incrustando y downloaded.txt sigue evitando re-descargas; solo se
+#    pierde el prefiltro local por .info.json).
+save_sidecars = os.environ.get("SAVE_SIDECARS", "1") != "0"
 # -------------------------------------------------
 
-os.makedirs(output_folder, exist_ok=True)
+output_folder.mkdir(parents=True, exist_ok=True)
 
 # Plantilla de nombre de archivo: título del video.mp3
-outtmpl = os.path.join(output_folder, "%(title)s.%(ext)s")
+outtmpl = str(output_folder / "%(title)s.%(ext)s")
 
 ydl_opts = {
-    # Mejor audio disponible (YouTube / YouTube Music)
-    "format": "bestaudio/best",
+    # Mejor audio disponible, exigiendo pistas de solo audio (vcodec=none):
+    # DASH ya sirve el audio separado, así que ffmpeg no tiene que demuxear
+    # un stream A+V completo. Con m4a se prefiere además el AAC nativo para
+    # que la extracción sea una copia de contenedor en vez de un re-encode.
+    # (La aceleración por GPU no pinta nada en este flujo: no hay vídeo que
+    # decodificar y AAC/MP3 no tienen encoder en NVENC.)
+    "format": (
+        "bestaudio[ext=m4a][vcodec=none]/bestaudio[vcodec=none]/bestaudio"
+        if audio_format == "m4a"
+        else "bestaudio[vcodec=none]/bestaudio"
+    ),
     # Postprocesado: extraer audio + metadatos + portada
     "postprocessors": [
         {
             "key": "FFmpegExtractAudio",
             "preferredcodec": audio_format,
-            "preferredquality": mp3_quality,
+            # "0" con m4a nativo equivale a -c copy; para MP3 manda la
+            # calidad configurada arriba
+            "preferredquality": "0" if audio_format == "m4a" else mp3_quality,
         },
         {
             "key": "FFmpegMetadata",
         },
         {
             "key": "EmbedThumbnail",
+            # si no queremos sidecars, borrar el fichero de portada tras
+            # incrustarla
+            "already_have_thumbnail": save_sidecars,
         },
     ],
     # Plantilla salida: título.ext dentro de output_folder
     "outtmpl": outtmpl,
-    # Guardar thumbnail y JSON de info para metadatos extendidos (incl. letras)
+    # El thumbnail hay que bajarlo siempre (lo consume EmbedThumbnail); el
+    # JSON de info (metadatos extendidos, incl. letras) solo si se piden
+    # sidecars
     "writethumbnail": True,
-    "writeinfojson": True,
+    "writeinfojson": save_sidecars,
     # No descargar subtítulos (puedes cambiar a True si los necesitas)
     "writesubtitles": False,
     # Mostrar progreso en consola
     "progress_hooks": [],
     # Continúa si un video falla
     "ignoreerrors": True,
-    # Si la URL es una playlist, descarga toda la lista
-    "yes_playlist": True,
+    # Si la URL es una playlist, descarga toda la lista (yt-dlp solo honra
+    # noplaylist; la antigua clave yes_playlist era letra muerta)
     "noplaylist": False,
     # No conservar el archivo de vídeo original tras extraer el audio
     "keepvideo": False,
+    # Caché de yt-dlp en disco (tokens de extractor, etc.) entre ejecuciones
+    "cachedir": str(BASE_DIR / ".ytcache"),
+    # Registro persistente de IDs descargados: yt-dlp corta en seco un vídeo
+    # ya conocido tras leer este fichero, sin repetir llamadas a la red
+    "download_archive": str(BASE_DIR / "downloaded.txt"),
+    # Procesar las entradas de playlist en streaming en vez de materializar
+    # todos los metadatos por adelantado
+    "lazy_playlist": True,
+    # Reintentos del extractor ante fallos transitorios de la API
+    "extractor_retries": 3,
+    # No dejar sockets colgados minutos con los timeouts por defecto
+    "socket_timeout": 15,
+    # Fragmentos DASH/HLS en paralelo y chunks HTTP grandes: los segmentos
+    # de audio son pequeños y el slow-start de TCP domina con un solo stream
+    "concurrent_fragment_downloads": 8,
+    "http_chunk_size": 10 * 1024 * 1024,
+    "retries": 10,
+    "fragment_retries": 10,
 }
 
-# Hook para ver progreso en consola
+if CURL_CFFI_AVAILABLE:
+    try:
+        from yt_dlp.networking.impersonate import ImpersonateTarget
+
+        ydl_opts["impersonate"] = ImpersonateTarget("chrome")
+    except ImportError:
+        # yt-dlp demasiado antiguo para impersonación; seguir sin ella
+        pass
+
+_EMBED_WITH_MUTAGEN = MUTAGEN_AVAILABLE and audio_format == "mp3"
+if _EMBED_WITH_MUTAGEN:
+    # El EmbedThumbnail de yt-dlp re-muxea el MP3 entero con ffmpeg; con
+    # mutagen basta una reescritura in situ de la cabecera ID3. Eso sí:
+    # YouTube suele servir la portada en WebP, que los reproductores no
+    # entienden dentro de un APIC, así que primero se convierte a PNG
+    # (una pasada de ffmpeg sobre la imagen, no sobre el audio).
+    ydl_opts["postprocessors"] = [
+        pp for pp in ydl_opts["postprocessors"] if pp.get("key") != "EmbedThumbnail"
+    ]
+    ydl_opts["postprocessors"].append(
+        {"key": "FFmpegThumbnailsConvertor", "format": "png", "when": "before_dl"}
+    )
+
+if shutil.which("aria2c"):
+    # aria2c abre varias conexiones con rangos por fichero, útil en enlaces
+    # de mucho ancho de banda y latencia alta
+    ydl_opts["external_downloader"] = "aria2c"
+    ydl_opts["external_downloader_args"] = {
+        "aria2c": ["-x", "16", "-s", "16", "-k", "1M"]
+    }
+
+if audio_format == "mp3":
+    # Si hay que re-codificar a MP3, que sea lo más barato posible: hilos
+    # automáticos de ffmpeg, VBR V0 de LAME (transparente, codifica menos
+    # que CBR 320) y sin esfuerzo extra de compresión. La última opción de
+    # ffmpeg gana, así que esto prevalece sobre la calidad por defecto.
+    ydl_opts["postprocessor_args"] = {
+        "ExtractAudio": ["-threads", "0", "-q:a", "0", "-compression_level", "0"]
+    }
+
+# Hook para ver progreso en consola (con lock: varios hilos imprimen a la vez)
+
+_print_lock = threading.Lock()
+# Último instante en que se imprimió progreso de cada fichero
+_last_print = {}
 
 
 def progreso(info):
     status = info.get("status")
     if status == "downloading":
-        print(
-            f"Descargando: {info.get('filename', '')} -> {info.get('_percent_str','')} {info.get('_eta_str','')}"
-        )
+        # yt-dlp dispara este hook cada ~100 ms por fichero; con varios hilos
+        # imprimir cada evento serializa todo en el lock de la TTY. Como
+        # mucho una línea por fichero cada medio segundo.
+        filename = info.get("filename", "")
+        now = time.monotonic()
+        if now - _last_print.get(filename, 0.0) < 0.5:
+            return
+        _last_print[filename] = now
+        with _print_lock:
+            sys.stdout.write(
+                f"Descargando: {filename} -> {info.get('_percent_str','')} {info.get('_eta_str','')}\n"
+            )
     elif status == "finished":
-        print(f"Descargado, convirtiendo: {info.get('filename','')}")
+        _last_print.pop(info.get("filename", ""), None)
+        with _print_lock:
+            print(f"Descargado, convirtiendo: {info.get('filename','')}")
     elif status == "error":
-        print(f"Error en: {info.get('filename','')}")
+        _last_print.pop(info.get("filename", ""), None)
+        with _print_lock:
+            print(f"Error en: {info.get('filename','')}")
 
 
 ydl_opts["progress_hooks"].append(progreso)
 
+# Una instancia de YoutubeDL por hilo: comparten ydl_opts pero no estado
+# interno, que no es seguro entre hilos.
+_ydl_local = threading.local()
+
+
+def _parece_playlist(url):
+    """Heurística barata: solo estas URLs justifican llamar al extractor."""
+    return "list=" in url or "/playlist" in url
+
+
+def expandir_playlists(lista_urls):
+    """Expande cada playlist en las URLs de sus vídeos, como generador.
+
+    Una sola consulta por playlist (process=False no resuelve formatos) y
+    los vídeos resultantes pueden repartirse entre los hilos de descarga
+    según se van produciendo. Las URLs sin pinta de playlist pasan tal
+    cual sin tocar la red: para un watch normal el extractor haría aquí
+    todo el trabajo de metadatos que el hilo de descarga repite después.
+    """
+    ydl = None
+    for url in lista_urls:
+        if not _parece_playlist(url):
+            yield url
+            continue
+        if ydl is None:
+            # extract_flat: las entradas de playlist se quedan en URL + id,
+            # sin resolver formatos que el hilo de descarga volvería a pedir
+            ydl = YoutubeDL({"quiet": True, "extract_flat": "in_playlist"})
+        try:
+            info = ydl.extract_info(url, download=False, process=False)
+        except Exception as e:
+            print(f"Aviso: no se pudo expandir '{url}': {e}")
+            yield url
+            continue
+        entries = (info or {}).get("entries")
+        if entries is None:
+            yield url
+            continue
+        for entry in entries:
+            video_url = entry.get("url")
+            if not video_url and entry.get("id"):
+                video_url = f"https://www.youtube.com/watch?v={entry['id']}"
+            if video_url:
+                yield video_url
+
+
+# ID de vídeo de YouTube dentro de una URL (watch?v=, youtu.be/, shorts/)
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|/shorts/)([0-9A-Za-z_-]{11})")
+
+# Línea útil del archivo de URLs: no vacía y que no empieza por '#'.
+# En bytes: el archivo se escanea mapeado en memoria sin decodificarlo entero.
+_URL_LINE_RE = re.compile(rb"(?m)^[^\S\n]*([^\s#]\S*)")
+
+
+def _ids_ya_descargados():
+    """IDs de los vídeos con .info.json ya escrito en la carpeta de salida.
+
+    Leer unos ficheros locales es órdenes de magnitud más barato que dejar
+    que yt-dlp repita las consultas HTTPS de metadatos de cada vídeo que ya
+    se bajó en una ejecución anterior.
+    """
+    seen = set()
+    try:
+        with os.scandir(output_folder) as it:
+            for entry in it:
+                if not entry.name.endswith(".info.json") or not entry.is_file():
+                    continue
+                try:
+                    with open(entry.path, encoding="utf-8") as f:
+                        vid = json.load(f).get("id")
+                except Exception:
+                    continue
+                if vid:
+                    seen.add(vid)
+    except OSError:
+        pass
+    return seen
+
+
+if MUTAGEN_AVAILABLE:
+
+    class _MutagenThumbPP(PostProcessor):
+        """Incrusta la portada en un MP3 reescribiendo solo la cabecera ID3."""
+
+        # Solo formatos que los reproductores aceptan dentro de un APIC; el
+        # convertor de thumbnails ya debería haber dejado un PNG
+        _MIMES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+        def run(self, info):
+            filepath = info.get("filepath") or ""
+            thumbs = info.get("thumbnails") or []
+            thumb_path = next(
+                (
+                    t.get("filepath")
+                    for t in reversed(thumbs)
+                    if t.get("filepath")
+                    and os.path.splitext(t["filepath"])[1].lower() in self._MIMES
+                    and os.path.exists(t["filepath"])
+                ),
+                None,
+            )
+            if filepath.endswith(".mp3") and thumb_path:
+                mime = self._MIMES[os.path.splitext(thumb_path)[1].lower()]
+                with open(thumb_path, "rb") as f:
+                    data = f.read()
+                tags = ID3(filepath)
+                tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data))
+                tags.save()
+            if not save_sidecars:
+                # Sin EmbedThumbnail nadie más borra las portadas: fuera el
+                # PNG convertido y el WebP original una vez incrustada
+                for t in thumbs:
+                    p = t.get("filepath")
+                    if p and os.path.exists(p):
+                        try:
+                            os.remove(p)
+                        except OSError:
+                            pass
+            return [], info
+
+
+def _descargar_una(url):
+    """Descarga una URL con la instancia YoutubeDL de su hilo."""
+    ydl = getattr(_ydl_local, "ydl", None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = YoutubeDL(ydl_opts)
+        if _EMBED_WITH_MUTAGEN:
+            ydl.add_post_processor(_MutagenThumbPP(), when="post_process")
+    try:
+        ydl.download([url])
+        return True
+    except Exception as e:
+        with _print_lock:
+            print(f"Ocurrió un error al descargar {url}: {e}")
+        return False
+
 
 def descargar_a_mp3(lista_urls):
-    if not lista_urls:
+    """Descarga las URLs de un iterable (lista o generador) en paralelo."""
+
+    # Filtrar lo ya descargado ANTES de expandir: un watch ya bajado no debe
+    # costar ni la llamada al extractor. Las URLs de playlist no se filtran
+    # aquí aunque lleven v= (saltarlas se llevaría la playlist entera).
+    seen = _ids_ya_descargados()
+    if seen:
+        lista_urls = (
+            u
+            for u in lista_urls
+            if _parece_playlist(u)
+            or not ((m := _VIDEO_ID_RE.search(u)) and m.group(1) in seen)
+        )
+
+    # Expandir playlists y repartir los vídeos entre los hilos: mientras un
+    # hilo está en la fase de red otro puede estar en la de ffmpeg. Todo el
+    # camino es de generadores: no se materializa la lista completa de URLs.
+    videos = expandir_playlists(lista_urls)
+
+    # Segundo filtro para las entradas recién salidas de una playlist
+    if seen:
+        videos = (
+            u
+            for u in videos
+            if not ((m := _VIDEO_ID_RE.search(u)) and m.group(1) in seen)
+        )
+
+    def _unicos(iterable):
+        # Dedupe por ID de vídeo (o por URL completa si no se reconoce el
+        # ID) sin romper el streaming: el mismo vídeo repetido entre la
+        # lista manual, el archivo y varias playlists se baja una sola vez
+        vistos = set()
+        for u in iterable:
+            m = _VIDEO_ID_RE.search(u)
+            clave = m.group(1) if m else u
+            if clave in vistos:
+                continue
+            vistos.add(clave)
+            yield u
+
+    videos = _unicos(videos)
+
+    with ThreadPoolExecutor(max_workers=download_workers) as pool:
+        resultados = list(pool.map(_descargar_una, videos))
+
+    if not resultados:
         print("No hay URLs en la lista. Agrega URLs en la variable 'urls'.")
         return
+    fallos = resultados.count(False)
+    if fallos:
+        print(f"\nTerminado con {fallos} error(es). Revisa la carpeta:", output_folder)
+    else:
+        print("\n¡Terminado! Revisa la carpeta:", output_folder)
+
+
+def iter_urls():
+    """Genera las URLs configuradas en el script y las del archivo de texto.
 
-    with YoutubeDL(ydl_opts) as ydl:
+    Al ser un generador no se construye ninguna lista intermedia: la primera
+    descarga puede arrancar sin esperar a terminar de leer el archivo.
+    """
+    yield from urls
+    if not urls_from_file:
+        return
+    if not urls_from_file.is_file():
+        print(f"Aviso: el archivo '{urls_from_file}' no existe; se ignorará.")
+        return
+    # Mapear el archivo y pasarle el regex en bytes: el SO sirve las páginas
+    # desde su caché, no se copia ni decodifica el buffer entero y solo las
+    # URLs que casan acaban convertidas a str
+    with open(urls_from_file, "rb") as f:
         try:
-            ydl.download(lista_urls)
-            print("\n¡Terminado! Revisa la carpeta:", output_folder)
-        except Exception as e:
-            print("Ocurrió un error al descargar:", str(e))
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # fichero vacío
+        with buf:
+            for m in _URL_LINE_RE.finditer(buf):
+                yield m.group(1).decode("utf-8")
 
 
 if __name__ == "__main__":
-    # Construir la lista final de URLs combinando las configuradas en el
-    # script y, opcionalmente, las leídas desde un archivo de texto.
-    all_urls = list(urls)
-    if urls_from_file:
-        if os.path.isfile(urls_from_file):
-            with open(urls_from_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith("#"):
-                        all_urls.append(line)
-        else:
-            print(f"Aviso: el archivo '{urls_from_file}' no existe; se ignorará.")
-
-    descargar_a_mp3(all_urls)
+    descargar_a_mp3(iter_urls())